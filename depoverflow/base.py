@@ -1,4 +1,5 @@
 import asyncio
+import time
 
 
 class InvalidJSONItem(ValueError):
@@ -23,9 +24,50 @@ class Item(object):
     def url(self):
         raise NotImplementedError
 
+    def key(self):
+        """Tuple identifying the item, used for equality and hashing.
+        """
+        raise NotImplementedError
+
+    def __eq__(self, other):
+        return self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
     def refresh(self):
         raise NotImplementedError
 
+    def batch_group(self):
+        """Group of items that are best checked together, or None.
+
+        In fail-fast mode, items of the same group are checked in the same
+        round.
+        """
+        return None
+
+    def last_activity(self):
+        """Time of the last known activity on the item, as a UNIX timestamp.
+
+        None if unknown.
+        """
+        return None
+
+    def change_likelihood(self, now=None):
+        """Estimate how likely the item is to have changed.
+
+        This is used to check the most likely items first in fail-fast mode.
+        The default is higher the more recent the last activity is, and
+        highest if it is unknown.
+        """
+        last_activity = self.last_activity()
+        if last_activity is None:
+            return 1.0
+        if now is None:
+            now = time.time()
+        days = max(now - last_activity, 0) / 86400
+        return 1.0 / (1.0 + days)
+
     @classmethod
     def from_json(cls, obj):
         raise NotImplementedError
@@ -54,9 +96,29 @@ class Batches(object):
         return wrapper
 
     def flush(self):
+        """Process the queued queries.
+
+        Queries made after this are processed immediately, until `collect()`
+        is called.
+        """
         self._flushed = True
         for processor, queries in self._batches:
-            processor(queries)
+            pending = list(queries)
+            queries.clear()
+            processor(pending)
+
+    def collect(self):
+        """Start queuing queries again, after a flush.
+        """
+        self._flushed = False
+
+    def cancel(self):
+        """Cancel the queued queries without processing them.
+        """
+        for processor, queries in self._batches:
+            for query, future in queries:
+                future.cancel()
+            queries.clear()
 
 
 batching = Batches()
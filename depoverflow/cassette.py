@@ -0,0 +1,94 @@
+import gzip
+import json
+import logging
+import requests
+
+
+logger = logging.getLogger(__name__)
+
+
+class MissingResponse(LookupError):
+    """Query was not recorded in the cassette being replayed."""
+
+
+class Cassette(object):
+    """Sends API queries, optionally recording or replaying the responses.
+
+    Responses are stored on disk as gzipped JSON, keyed by URL, along with
+    the links from their `Link` header if any.
+    """
+    def __init__(self):
+        self.mode = None
+        self.filename = None
+        self.responses = {}
+        self.links = {}
+
+    def record(self, filename):
+        self.mode = 'record'
+        self.filename = filename
+        self.responses = {}
+        self.links = {}
+
+    def replay(self, filename):
+        with gzip.open(filename, 'rt', encoding='utf-8') as fp:
+            obj = json.load(fp)
+        if (
+            not isinstance(obj, dict)
+            or not isinstance(obj.get('responses'), dict)
+            or not isinstance(obj.get('links'), dict)
+        ):
+            raise ValueError("Invalid cassette format")
+        responses = obj['responses']
+        logger.info("Loaded %d responses from %s", len(responses), filename)
+        self.mode = 'replay'
+        self.filename = filename
+        self.responses = responses
+        self.links = obj['links']
+
+    def save(self):
+        if self.mode != 'record':
+            return
+        logger.info(
+            "Saving %d responses to %s",
+            len(self.responses), self.filename,
+        )
+        with gzip.open(self.filename, 'wt', encoding='utf-8') as fp:
+            json.dump(
+                {'responses': self.responses, 'links': self.links}, fp,
+                sort_keys=True, separators=(',', ':'),
+            )
+
+    def get_json(self, url, key=None):
+        """Get the JSON response for a URL.
+        """
+        response, links = self.get_json_links(url, key)
+        return response
+
+    def get_json_links(self, url, key=None):
+        """Get the JSON response for a URL, and the links from its header.
+
+        The links are a dictionary mapping each `rel` to a URL. The response
+        is recorded under `key` if given instead of the URL, for queries whose
+        URL depends on the current status.
+        """
+        if key is None:
+            key = url
+        if self.mode == 'replay':
+            try:
+                response = self.responses[key]
+            except KeyError:
+                raise MissingResponse(url) from None
+            return response, self.links.get(key, {})
+
+        req = requests.get(url)
+        req.raise_for_status()
+        response = req.json()
+        links = {rel: link['url'] for rel, link in req.links.items()}
+        if self.mode == 'record':
+            self.responses[key] = response
+            if links:
+                self.links[key] = links
+        return response, links
+
+
+cassette = Cassette()
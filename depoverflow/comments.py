@@ -0,0 +1,204 @@
+import os
+import re
+
+
+# String literals, skipped so that comment markers inside them are ignored
+DOUBLE_QUOTED = r'"(?:\\.|[^"\\\n])*"'
+SINGLE_QUOTED = r"'(?:\\.|[^'\\\n])*'"
+CHARACTER = r"'(?:\\.[^'\n]*|[^'\\\n])'"
+BACKTICK = r'`(?:\\.|[^`\\])*`'
+
+
+class Language(object):
+    """Comment syntax of a language, used to find the comments in a file.
+
+    `block_comments` is a list of (start, end) delimiters, `line_comments` a
+    list of prefixes for comments running to the end of the line, and
+    `strings` a list of regular expressions matching string literals, which
+    must start with a literal character. If `nested` is True, block comments
+    can contain other block comments.
+    """
+    def __init__(self, block_comments=(), line_comments=(), strings=(),
+                 nested=False):
+        self._nested = nested
+        self._delimiters = {}
+        patterns = []
+        for i, (start, end) in enumerate(block_comments):
+            name = 'b%d' % i
+            self._delimiters[name] = start, end
+            if nested:
+                # Only match the start, the end is found in comments()
+                pattern = '(?P<{name}>{start})'
+            else:
+                pattern = '(?P<{name}>{start}.*?(?:{end}|\\Z))'
+            patterns.append(pattern.format(
+                name=name,
+                start=re.escape(start),
+                end=re.escape(end),
+            ))
+        for i, start in enumerate(line_comments):
+            name = 'l%d' % i
+            self._delimiters[name] = start, ''
+            patterns.append('(?P<{name}>{start}[^\\n]*)'.format(
+                name=name,
+                start=re.escape(start),
+            ))
+        for i, string in enumerate(strings):
+            patterns.append('(?P<s%d>%s)' % (i, string))
+        # Start with a lookahead on the first characters of the delimiters,
+        # so the alternation is only tried where it could match
+        first_characters = {
+            start[0]
+            for start, end in self._delimiters.values()
+        } | {string[0] for string in strings}
+        self._regex = re.compile(
+            '(?=[{first}])(?:{patterns})'.format(
+                first=re.escape(''.join(sorted(first_characters))),
+                patterns='|'.join(patterns),
+            ),
+            re.DOTALL,
+        )
+
+    def comments(self, text, stop=None):
+        """Iterate on the content of the comments in the text.
+
+        If `stop` is given, stop at the first comment starting after it.
+        """
+        if stop is None:
+            stop = len(text)
+        pos = 0
+        while True:
+            m = self._regex.search(text, pos)
+            if m is None or m.start() > stop:
+                return
+            pos = m.end()
+            if m.lastgroup not in self._delimiters:
+                # String literal
+                continue
+            start, end = self._delimiters[m.lastgroup]
+            if self._nested and end:
+                comment_start = pos
+                comment_end, pos = self._find_nested_end(text, pos, start, end)
+                yield text[comment_start:comment_end]
+                continue
+            comment = m.group(0)[len(start):]
+            if end and comment.endswith(end):
+                comment = comment[:-len(end)]
+            yield comment
+
+    @staticmethod
+    def _find_nested_end(text, pos, start, end):
+        """Find the end of a nested block comment.
+
+        Returns the position of the end delimiter and the position after it,
+        or the end of the text twice if the comment is not terminated.
+        """
+        depth = 1
+        while True:
+            next_end = text.find(end, pos)
+            if next_end == -1:
+                return len(text), len(text)
+            next_start = text.find(start, pos, next_end)
+            if next_start != -1:
+                depth += 1
+                pos = next_start + len(start)
+            else:
+                depth -= 1
+                pos = next_end + len(end)
+                if depth == 0:
+                    return next_end, pos
+
+
+# Docstrings are considered comments
+PYTHON = Language(
+    block_comments=[('"""', '"""'), ("'''", "'''")],
+    line_comments=['#'],
+    strings=[DOUBLE_QUOTED, SINGLE_QUOTED],
+)
+
+C = Language(
+    block_comments=[('/*', '*/')],
+    line_comments=['//'],
+    strings=[DOUBLE_QUOTED, SINGLE_QUOTED],
+)
+
+JAVASCRIPT = Language(
+    block_comments=[('/*', '*/')],
+    line_comments=['//'],
+    strings=[DOUBLE_QUOTED, SINGLE_QUOTED, BACKTICK],
+)
+
+# Like C, but block comments nest
+C_NESTED = Language(
+    block_comments=[('/*', '*/')],
+    line_comments=['//'],
+    strings=[DOUBLE_QUOTED, SINGLE_QUOTED],
+    nested=True,
+)
+
+# Single quotes are also used for lifetimes, only match character literals
+RUST = Language(
+    block_comments=[('/*', '*/')],
+    line_comments=['//'],
+    strings=[DOUBLE_QUOTED, CHARACTER],
+    nested=True,
+)
+
+SHELL = Language(
+    line_comments=['#'],
+    strings=[DOUBLE_QUOTED, SINGLE_QUOTED],
+)
+
+SQL = Language(
+    block_comments=[('/*', '*/')],
+    line_comments=['--'],
+    strings=[DOUBLE_QUOTED, SINGLE_QUOTED],
+)
+
+HTML = Language(
+    block_comments=[('<!--', '-->')],
+)
+
+
+# Only languages whose comments are fully described here, extensions that
+# are ambiguous (like .m) or languages with other kinds of comments (like Ruby
+# or Perl) are scanned entirely
+LANGUAGES = {
+    PYTHON: ['.py', '.pyi', '.pyx', '.pxd'],
+    C: [
+        '.c', '.h', '.cc', '.cpp', '.cxx', '.hh', '.hpp', '.hxx',
+        '.mm', '.java', '.cs',
+    ],
+    C_NESTED: ['.kt', '.scala', '.swift'],
+    JAVASCRIPT: ['.js', '.jsx', '.mjs', '.cjs', '.ts', '.tsx', '.go'],
+    RUST: ['.rs'],
+    SHELL: ['.sh', '.bash', '.zsh', '.r'],
+    SQL: ['.sql'],
+    HTML: ['.html', '.htm', '.xml', '.svg'],
+}
+
+EXTENSIONS = {
+    extension: language
+    for language, extensions in LANGUAGES.items()
+    for extension in extensions
+}
+
+
+def get_language(filename):
+    """Get the language of a file from its extension, or None if unknown.
+    """
+    extension = os.path.splitext(str(filename))[1].lower()
+    return EXTENSIONS.get(extension)
+
+
+def find_comments(filename, text, stop=None):
+    """Iterate on the comments in a file's content.
+
+    If the language is not known, the whole text is returned. If `stop` is
+    given, stop at the first comment starting after it.
+    """
+    language = get_language(filename)
+    if language is None:
+        return [text]
+    else:
+        return language.comments(text, stop)
@@ -1,7 +1,14 @@
+import asyncio
+from datetime import datetime, timezone
+import logging
 import re
-import requests
+from urllib.parse import parse_qs, urlparse
 
-from .base import Item, InvalidReference
+from .base import Item, InvalidReference, batching
+from .cassette import MissingResponse, cassette
+
+
+logger = logging.getLogger(__name__)
 
 
 re_issue = re.compile(
@@ -13,6 +20,135 @@ re_pull_request = re.compile(
 )
 
 
+@batching.register
+def batch_queries(queries):
+    """Batches queries to GitHub.
+
+    For repositories with enough items, a single list of the issues updated
+    since the oldest stored date is requested, instead of each issue. The
+    future resolves to None for items that were not updated.
+    """
+    MIN_REPO_ITEMS = 3
+    PAGE_SIZE = 100
+
+    logger.info("Sending %d GitHub queries", len(queries))
+
+    # Organize queries by repository and issue number
+    organized_queries = {}
+    for (repo, number, updated_date), future in queries:
+        organized_queries.setdefault(repo, {}).setdefault(
+            number, [],
+        ).append((updated_date, future))
+
+    # Loop on repositories
+    for repo, issues in organized_queries.items():
+        # Items never retrieved need to be queried individually
+        single_queries = {
+            number: futures
+            for number, futures in issues.items()
+            if any(updated_date is None for updated_date, future in futures)
+        }
+        remaining = {
+            number: futures
+            for number, futures in issues.items()
+            if number not in single_queries
+        }
+
+        if len(remaining) >= MIN_REPO_ITEMS:
+            since = min(
+                updated_date
+                for futures in remaining.values()
+                for updated_date, future in futures
+            )
+            logger.info(
+                "Listing issues in %s for %d items, since=%s",
+                repo, len(remaining), since,
+            )
+            page = 1
+            while True:
+                url = (
+                    'https://api.github.com/repos/{repo}/issues'
+                    + '?state=all&since={since}'
+                    + '&per_page={per_page}&page={page}'
+                ).format(
+                    repo=repo,
+                    since=since,
+                    per_page=PAGE_SIZE,
+                    page=page,
+                )
+                # Record without `since`, which changes once the status file
+                # is updated, so the cassette can still be replayed then
+                key = (
+                    'https://api.github.com/repos/{repo}/issues'
+                    + '?state=all&per_page={per_page}&page={page}'
+                ).format(
+                    repo=repo,
+                    per_page=PAGE_SIZE,
+                    page=page,
+                )
+                try:
+                    response, links = cassette.get_json_links(url, key)
+                except MissingResponse:
+                    if page > 1:
+                        raise
+                    # Replaying, and the issues were queried individually
+                    # when recording (for example because they were new)
+                    logger.info(
+                        "No recorded list for %s, querying %d issues instead",
+                        repo, len(remaining),
+                    )
+                    break
+
+                # Resolve futures for issues contained in this page
+                for issue in response:
+                    for updated_date, future in remaining.pop(
+                        issue['number'], [],
+                    ):
+                        future.set_result(issue)
+
+                if page == 1:
+                    # There is no 'last' link if this is the only page
+                    if 'last' in links:
+                        last_page = int(parse_qs(
+                            urlparse(links['last']).query,
+                        )['page'][0])
+                    else:
+                        last_page = 1
+
+                    # If the list is longer than the issues left, give up
+                    # and get those individually
+                    if last_page - page > len(remaining):
+                        logger.info(
+                            "List has %d pages, querying %d issues instead",
+                            last_page, len(remaining),
+                        )
+                        break
+
+                # Last page, the other issues were not updated
+                if page >= last_page:
+                    for futures in remaining.values():
+                        for updated_date, future in futures:
+                            future.set_result(None)
+                    remaining = {}
+                    break
+                elif not remaining:
+                    break
+
+                page += 1
+
+        # Query the rest individually
+        single_queries.update(remaining)
+        for number, futures in sorted(single_queries.items()):
+            issue = cassette.get_json(
+                'https://api.github.com/repos/{repo}/issues/{number}'.format(
+                    repo=repo,
+                    number=number,
+                ),
+            )
+            for updated_date, future in futures:
+                future.set_result(issue)
+
+
 class GithubBase(Item):
     """A GitHub issue or pull request.
     """
@@ -20,41 +156,56 @@ class GithubBase(Item):
         self.repo = repo
         self.number = number
         self.updated_date = None
+        self.state = None
 
-    def __eq__(self, other):
-        return (
-            self.TYPE == other.TYPE
-            and self.repo == other.repo
-            and self.number == other.number
-        )
-
-    def __hash__(self):
-        return hash(
-            (self.TYPE, self.repo, self.number),
-        )
+    def key(self):
+        return (self.TYPE, self.repo, self.number)
 
     def refresh(self):
+        issue = batch_queries((self.repo, self.number, self.updated_date))
+
+        return asyncio.ensure_future(self._check(issue))
+
+    async def _check(self, issue):
         changed = False
 
-        req = requests.get(
-            'https://api.github.com/repos/{repo}/issues/{number}'.format(
-                repo=self.repo,
-                number=self.number,
-            ),
-        )
-        req.raise_for_status()
-        updated_date = req.json()['updated_at']
+        issue = await issue
+        if issue is None:
+            # Not updated since last time
+            return changed
+
+        updated_date = issue['updated_at']
         if self.updated_date != updated_date:
             self.updated_date = updated_date
             changed = True
+        self.state = issue.get('state')
 
         return changed
 
+    def batch_group(self):
+        # Items of a repository are answered by a single list query
+        return ('github', self.repo)
+
+    def last_activity(self):
+        if self.updated_date is None:
+            return None
+        return datetime.strptime(
+            self.updated_date, '%Y-%m-%dT%H:%M:%SZ',
+        ).replace(tzinfo=timezone.utc).timestamp()
+
+    def change_likelihood(self, now=None):
+        # Open issues are more likely to see activity
+        likelihood = super(GithubBase, self).change_likelihood(now)
+        if self.state == 'open':
+            likelihood *= 2
+        return likelihood
+
     @classmethod
     def from_json(cls, obj):
-        assert obj.keys() <= {'repo', 'number', 'updated_date'}
+        assert obj.keys() <= {'repo', 'number', 'updated_date', 'state'}
         item = cls(obj['repo'], obj['number'])
         item.updated_date = obj.get('updated_date')
+        item.state = obj.get('state')
         return item
 
     def to_json(self):
@@ -62,6 +213,7 @@ class GithubBase(Item):
             'repo': self.repo,
             'number': self.number,
             'updated_date': self.updated_date,
+            'state': self.state,
         }
 
 
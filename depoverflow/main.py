@@ -1,13 +1,18 @@
+import argparse
 import asyncio
 from collections import OrderedDict
+import hashlib
 import logging
 import pathlib
 from pkg_resources import iter_entry_points
 import re
 import sys
+import time
 import toml
 
 from .base import InvalidReference, batching
+from .cassette import MissingResponse, cassette
+from .comments import find_comments
 
 
 logger = logging.getLogger(__name__)
@@ -16,6 +21,10 @@ logger = logging.getLogger(__name__)
 item_classes = None
 
 
+# Number of items to check at a time in fail-fast mode
+FAIL_FAST_ROUND_SIZE = 100
+
+
 re_url = re.compile(r'https?://[a-zA-Z0-9$=?_@.&+!*(),%/:-]+')
 
 
@@ -29,9 +38,22 @@ def load_item_classes():
     return classes
 
 
-async def check(items):
+def _is_changed(item, ret):
+    if ret is True:
+        logger.warning("Item has changed: %s", item.url())
+        return True
+    elif ret is not False:
+        raise AssertionError("Returned value is not True or False")
+    return False
+
+
+async def check(items, fail_fast=False):
     """Check whether referenced items have changed.
     """
+    if fail_fast:
+        return await check_fail_fast(items)
+
+    batching.collect()
     changed = False
     futures = []
 
@@ -39,25 +61,106 @@ async def check(items):
         ret = item.refresh()
         if asyncio.isfuture(ret):
             futures.append((item, ret))
-        elif ret is True:
+        elif _is_changed(item, ret):
             changed = True
-            logger.warning("Item has changed: %s", item.url())
-        elif ret is not False:
-            raise AssertionError("Returned value is not True or False")
 
-    batching.flush()
+    try:
+        batching.flush()
+    except Exception:
+        await _cancel(futures)
+        raise
 
     for item, future in futures:
         ret = await future
-        if ret is True:
+        if _is_changed(item, ret):
             changed = True
-            logger.warning("Item has changed: %s", item.url())
-        elif ret is not False:
-            raise AssertionError("Returned value is not True or False")
 
     return changed
 
 
+async def _cancel(futures):
+    batching.cancel()
+    for item, future in futures:
+        future.cancel()
+    await asyncio.gather(
+        *(future for item, future in futures),
+        return_exceptions=True,
+    )
+
+
+def _fail_fast_rounds(items):
+    """Split sorted items into rounds, keeping batch groups together.
+
+    A group is checked in the round of its most likely item, so rounds can
+    be larger than `FAIL_FAST_ROUND_SIZE`.
+    """
+    groups = {}
+    for item in items:
+        group = item.batch_group()
+        if group is not None:
+            groups.setdefault(group, []).append(item)
+
+    round_items = []
+    seen_groups = set()
+    for item in items:
+        group = item.batch_group()
+        if group is None:
+            round_items.append(item)
+        elif group not in seen_groups:
+            seen_groups.add(group)
+            round_items.extend(groups[group])
+        if len(round_items) >= FAIL_FAST_ROUND_SIZE:
+            yield round_items
+            round_items = []
+    if round_items:
+        yield round_items
+
+
+async def check_fail_fast(items):
+    """Check whether any referenced item has changed, stopping at the first.
+
+    Items are checked in rounds, starting with the most likely to have
+    changed. All the changes from the round where the first one is found are
+    reported.
+    """
+    now = time.time()
+    items = sorted(
+        items,
+        key=lambda item: item.change_likelihood(now),
+        reverse=True,
+    )
+
+    for round_items in _fail_fast_rounds(items):
+        batching.collect()
+        futures = []
+
+        for item in round_items:
+            ret = item.refresh()
+            if asyncio.isfuture(ret):
+                futures.append((item, ret))
+            elif _is_changed(item, ret):
+                await _cancel(futures)
+                return True
+
+        try:
+            batching.flush()
+        except Exception:
+            await _cancel(futures)
+            raise
+
+        # All the queries of the round were sent, and the items updated, so
+        # report every change
+        changed = False
+        for item, future in futures:
+            ret = await future
+            if _is_changed(item, ret):
+                changed = True
+        if changed:
+            return True
+
+    return False
+
+
 def extract(stored_items, files):
     """Find references in source code, update `depoverflow.toml`.
     """
@@ -66,12 +169,20 @@ def extract(stored_items, files):
     # Loop on files
     for filename in files:
         with open(filename) as file:
-            # Loop on lines of the file
-            for line in file:
-                # Find URLs
-                for m in re_url.finditer(line):
-                    logger.info("Found URL %s", m.group(0))
-                    urls.add(m.group(0))
+            text = file.read()
+        # Finding comments is much slower than finding URLs, so only look
+        # for comments in files with URLs, and up to the last one
+        last_url = None
+        for last_url in re_url.finditer(text):
+            pass
+        if last_url is None:
+            continue
+        # Loop on comments of the file (or whole file if unknown language)
+        for comment in find_comments(filename, text, last_url.start()):
+            # Find URLs
+            for m in re_url.finditer(comment):
+                logger.info("Found URL %s", m.group(0))
+                urls.add(m.group(0))
     logger.info("Found %d URLs in source code", len(urls))
 
     # Identify items from URLs
@@ -105,14 +216,158 @@ def extract(stored_items, files):
     return stored_items, changed
 
 
+def parse_shard(value):
+    """Parse a shard specification `i/n`, with 1 <= i <= n.
+    """
+    try:
+        index, count = value.split('/')
+        index, count = int(index), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError("Shard should be of the form i/n")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError("Shard should be between 1 and n")
+    return index, count
+
+
+def get_shard(item, count):
+    """Get the shard of an item, between 1 and `count`.
+
+    This hashes the item's key with SHA1 rather than using `hash()`, which is
+    randomized per process, so that all workers agree.
+    """
+    digest = hashlib.sha1(repr(item.key()).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count + 1
+
+
+def load_status(filename):
+    """Load items from a status file.
+    """
+    with open(filename) as fp:
+        status = toml.load(fp)
+    items = set()
+    for obj in status['items']:
+        type_ = obj.pop('type')
+        class_ = item_classes[type_]
+        items.add(class_.from_json(obj))
+    return items
+
+
+def save_status(items, filename):
+    """Save items to a status file, sorted.
+    """
+    items_json = [
+        OrderedDict(sorted(dict(item.to_json(), type=item.TYPE).items()))
+        for item in sorted(
+            items,
+            key=lambda i: (i.TYPE, i.url()),
+        )
+    ]
+    with open(filename, 'w') as fp:
+        toml.dump({'items': items_json}, fp)
+
+
+def merge(filenames):
+    """Combine the items from multiple (sharded) status files.
+    """
+    items = set()
+    for filename in filenames:
+        shard_items = load_status(filename)
+        logger.info(
+            "Loaded %d items from status file %s",
+            len(shard_items), filename,
+        )
+        for item in shard_items:
+            if item in items:
+                logger.warning("Item in multiple files: %s", item.url())
+                items.remove(item)
+            items.add(item)
+    return items
+
+
 def main():
     global item_classes
 
+    parser = argparse.ArgumentParser(
+        description="Watches StackOverflow answers and GitHub issues "
+        + "referenced in code for changes",
+    )
+    parser.add_argument(
+        '-o', '--output', default='depoverflow.status',
+        help="Status file to write (default: depoverflow.status, required "
+        + "with --shard)",
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        '--record', metavar='CASSETTE',
+        help="Save the API responses to this file",
+    )
+    mode.add_argument(
+        '--replay', metavar='CASSETTE',
+        help="Use the API responses from this file instead of the network",
+    )
+    parser.add_argument(
+        '--shard', metavar='i/n', type=parse_shard,
+        help="Only check the i-th of n parts of the items, and only write "
+        + "those to the status file",
+    )
+    parser.add_argument(
+        '--fail-fast', action='store_true',
+        help="Stop at the first change, checking the items most likely to "
+        + "have changed first",
+    )
+    subparsers = parser.add_subparsers(dest='command')
+    parser_merge = subparsers.add_parser(
+        'merge',
+        help="Combine the status files written by sharded runs",
+    )
+    parser_merge.add_argument(
+        '-o', '--output', default=argparse.SUPPRESS,
+        help="Status file to write (default: depoverflow.status)",
+    )
+    parser_merge.add_argument('status_files', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'merge':
+        if args.shard or args.fail_fast or args.record or args.replay:
+            parser.error(
+                "--shard, --fail-fast, --record and --replay can't be used "
+                + "with merge",
+            )
+    elif args.shard:
+        # Don't overwrite the full status file with only part of the items
+        if (
+            pathlib.Path(args.output).resolve()
+            == pathlib.Path('depoverflow.status').resolve()
+        ):
+            parser.error(
+                "--shard requires -o/--output, to a file other than "
+                + "depoverflow.status",
+            )
+
     logging.basicConfig(level=logging.INFO)
 
     # Load known item types from entrypoints
     item_classes = load_item_classes()
 
+    if args.command == 'merge':
+        try:
+            items = merge(args.status_files)
+        except OSError as e:
+            logger.critical("Can't read status file: %s", e)
+            sys.exit(1)
+        logger.info("Saving %d items to status file", len(items))
+        save_status(items, args.output)
+        sys.exit(0)
+
+    if args.record:
+        cassette.record(args.record)
+    elif args.replay:
+        try:
+            cassette.replay(args.replay)
+        except (OSError, ValueError) as e:
+            logger.critical("Can't read cassette %s: %s", args.replay, e)
+            sys.exit(1)
+
     # Load config
     try:
         with open('depoverflow.toml') as fp:
@@ -123,15 +378,9 @@ def main():
 
     # Load items from status file
     try:
-        with open('depoverflow.status') as fp:
-            status = toml.load(fp)
+        items = load_status('depoverflow.status')
     except FileNotFoundError:
-        status = {'items': []}
-    items = set()
-    for obj in status['items']:
-        type_ = obj.pop('type')
-        class_ = item_classes[type_]
-        items.add(class_.from_json(obj))
+        items = set()
     logger.info("Loaded %d items from status file", len(items))
 
     # Update status from source files
@@ -150,23 +399,46 @@ def main():
         if not did_match:
             logger.warning("Source doesn't match anything: %s", pattern)
     logger.info("Reading %d files", len(source_files))
+    stored_items = set(items)
     items, source_changed = extract(items, source_files)
 
+    # Only keep the items from our shard
+    if args.shard:
+        index, count = args.shard
+        items = {item for item in items if get_shard(item, count) == index}
+        logger.info(
+            "Checking %d items in shard %d/%d",
+            len(items), index, count,
+        )
+
     # Check items online
-    loop = asyncio.get_event_loop()
-    items_changed = loop.run_until_complete(check(items))
+    if args.fail_fast and source_changed:
+        # Only get the current status of the new items, so they are not
+        # reported as changed next time
+        logger.info("Source changed, only checking new items")
+        to_check = items - stored_items
+        fail_fast = False
+    else:
+        to_check = items
+        fail_fast = args.fail_fast
+    items_changed = False
+    if to_check:
+        loop = asyncio.get_event_loop()
+        try:
+            items_changed = loop.run_until_complete(
+                check(to_check, fail_fast=fail_fast),
+            )
+        except MissingResponse as e:
+            logger.critical(
+                "No recorded response for %s in cassette %s",
+                e.args[0], args.replay,
+            )
+            sys.exit(1)
+    cassette.save()
 
     # Save status file
     logger.info("Saving %d items to status file", len(items))
-    items_json = [
-        OrderedDict(sorted(dict(item.to_json(), type=item.TYPE).items()))
-        for item in sorted(
-            items,
-            key=lambda i: (i.TYPE, i.url()),
-        )
-    ]
-    with open('depoverflow.status', 'w') as fp:
-        toml.dump({'items': items_json}, fp)
+    save_status(items, args.output)
 
     # Warn of changes
     if source_changed or items_changed:
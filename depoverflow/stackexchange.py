@@ -1,9 +1,9 @@
 import asyncio
 import logging
 import re
-import requests
 
 from .base import Item, InvalidReference, batching
+from .cassette import cassette
 from .utils import batch
 
 
@@ -52,6 +52,9 @@ def batch_queries(queries):
 
     # Loop on groups
     for (type, site), queries in organized_queries.items():
+        # Sort so the URLs are the same across runs, for replay
+        queries = sorted(queries, key=lambda q: q[0])
+
         # Loop over batches of size <= 100
         for queries in batch(queries, BATCH_SIZE):
             logger.info(
@@ -61,7 +64,7 @@ def batch_queries(queries):
             queries = dict(queries)
             if type == 'post':
                 # Send query
-                req = requests.get(
+                response = cassette.get_json(
                     (
                         'https://api.stackexchange.com/2.3'
                         + '/posts/{ids}?site={site}'
@@ -70,15 +73,14 @@ def batch_queries(queries):
                         site=site,
                     )
                 )
-                req.raise_for_status()
 
                 # Resolve futures for queries contained in this batch
-                for post in req.json()['items']:
+                for post in response['items']:
                     future = queries[post['post_id']]
                     future.set_result(post)
             elif type == 'comments':
                 # Send query
-                req = requests.get(
+                response = cassette.get_json(
                     (
                         'https://api.stackexchange.com/2.3'
                         + '/posts/{ids}/comments?site={site}'
@@ -87,11 +89,10 @@ def batch_queries(queries):
                         site=site,
                     )
                 )
-                req.raise_for_status()
 
                 # Organize comments by post
                 posts = {id: [] for id in queries.keys()}
-                for item in req.json()['items']:
+                for item in response['items']:
                     posts[item['post_id']].append(item)
 
                 # Resolve futures for queries contained in this batch
@@ -110,18 +111,25 @@ class StackExchangeBase(Item):
         self.id = id
         self.last_edit_date = None
         self.last_comment_date = None
-
-    def __eq__(self, other):
-        return (
-            self.TYPE == other.TYPE
-            and self.site == other.site
-            and self.id == other.id
-        )
-
-    def __hash__(self):
-        return hash(
-            (self.TYPE, self.site, self.id),
-        )
+        self.creation_date = None
+
+    def key(self):
+        return (self.TYPE, self.site, self.id)
+
+    def last_activity(self):
+        # The creation date is only unknown if the item was never checked
+        dates = [
+            date
+            for date in (
+                self.creation_date,
+                self.last_edit_date,
+                self.last_comment_date,
+            )
+            if date is not None
+        ]
+        if not dates:
+            return None
+        return max(dates)
 
 
 class StackExchangeQuestion(StackExchangeBase):
@@ -160,6 +168,7 @@ class StackExchangeQuestion(StackExchangeBase):
         if question.get('last_edit_date') != self.last_edit_date:
             self.last_edit_date = question['last_edit_date']
             changed = True
+        self.creation_date = question.get('creation_date')
 
         # Check last comment
         comments = await comments
@@ -187,10 +196,12 @@ class StackExchangeQuestion(StackExchangeBase):
     def from_json(cls, obj):
         assert obj.keys() <= {
             'site', 'id', 'last_edit_date', 'last_comment_date',
+            'creation_date',
         }
         item = cls(obj['site'], obj['id'])
         item.last_edit_date = obj.get('last_edit_date')
         item.last_comment_date = obj.get('last_comment_date')
+        item.creation_date = obj.get('creation_date')
         return item
 
     def to_json(self):
@@ -199,6 +210,7 @@ class StackExchangeQuestion(StackExchangeBase):
             'id': self.id,
             'last_edit_date': self.last_edit_date,
             'last_comment_date': self.last_comment_date,
+            'creation_date': self.creation_date,
         }
 
 
@@ -238,6 +250,7 @@ class StackExchangeAnswer(StackExchangeBase):
         if answer.get('last_edit_date') != self.last_edit_date:
             self.last_edit_date = answer['last_edit_date']
             changed = True
+        self.creation_date = answer.get('creation_date')
 
         # Check last comment
         comments = await comments
@@ -265,10 +278,12 @@ class StackExchangeAnswer(StackExchangeBase):
     def from_json(cls, obj):
         assert obj.keys() <= {
             'site', 'id', 'last_edit_date', 'last_comment_date',
+            'creation_date',
         }
         item = cls(obj['site'], obj['id'])
         item.last_edit_date = obj.get('last_edit_date')
         item.last_comment_date = obj.get('last_comment_date')
+        item.creation_date = obj.get('creation_date')
         return item
 
     def to_json(self):
@@ -277,4 +292,5 @@ class StackExchangeAnswer(StackExchangeBase):
             'id': self.id,
             'last_edit_date': self.last_edit_date,
             'last_comment_date': self.last_comment_date,
+            'creation_date': self.creation_date,
         }
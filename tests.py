@@ -1,6 +1,16 @@
+import asyncio
+import gzip
+import json
+import os
+import tempfile
 import unittest
+from unittest import mock
 
+from depoverflow.cassette import Cassette, MissingResponse, cassette
+from depoverflow.comments import find_comments
 from depoverflow.github import GithubIssue, GithubPullRequest
+import depoverflow.main
+from depoverflow.main import check, get_shard, merge, save_status
 from depoverflow.stackexchange import StackExchangeQuestion, \
     StackExchangeAnswer
 from depoverflow.utils import batch
@@ -91,6 +101,439 @@ class TestReferences(unittest.TestCase):
         )
 
 
+class TestComments(unittest.TestCase):
+    def test_python(self):
+        self.assertEqual(
+            list(find_comments(
+                'test.py',
+                '# first\n'
+                'a = "not # a comment" + \'nor # this\'  # second\n'
+                'def f():\n'
+                '    """Docstring\n    continued"""\n',
+            )),
+            [' first', ' second', 'Docstring\n    continued'],
+        )
+
+    def test_c(self):
+        self.assertEqual(
+            list(find_comments(
+                'test.cpp',
+                'int a = 1; // first\n'
+                'const char *s = "/* not a comment */"; /* second\n'
+                ' * line */\n'
+                'char c = \'"\'; // third\n'
+                '/* unterminated',
+            )),
+            [' first', ' second\n * line ', ' third', ' unterminated'],
+        )
+
+    def test_rust(self):
+        self.assertEqual(
+            list(find_comments(
+                'test.rs',
+                "fn f<'a>(s: &'a str) -> char { '\\'' } // comment\n",
+            )),
+            [' comment'],
+        )
+
+    def test_nested(self):
+        self.assertEqual(
+            list(find_comments(
+                'test.rs',
+                'a /* outer /* inner */ https://example.org/ */ b\n'
+                '/* unterminated /* */',
+            )),
+            [
+                ' outer /* inner */ https://example.org/ ',
+                ' unterminated /* */',
+            ],
+        )
+
+    def test_ambiguous(self):
+        for filename in ('test.m', 'test.rb', 'test.pl', 'test.lua'):
+            self.assertEqual(
+                list(find_comments(filename, '% https://example.org/')),
+                ['% https://example.org/'],
+            )
+
+    def test_stop(self):
+        self.assertEqual(
+            list(find_comments('test.py', '# one\n# two\n# three\n', 7)),
+            [' one', ' two'],
+        )
+
+    def test_unknown(self):
+        self.assertEqual(
+            list(find_comments('README', 'some text')),
+            ['some text'],
+        )
+
+
+class TestCassette(unittest.TestCase):
+    def tearDown(self):
+        cassette.mode = None
+        cassette.filename = None
+        cassette.responses = {}
+        cassette.links = {}
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'cassette.json.gz')
+            recorded = Cassette()
+            recorded.record(filename)
+            recorded.responses['https://example.org/'] = {'a': [1, 2]}
+            recorded.links['https://example.org/'] = {
+                'next': 'https://example.org/?page=2',
+            }
+            recorded.save()
+
+            replayed = Cassette()
+            replayed.replay(filename)
+            self.assertEqual(
+                replayed.get_json('https://example.org/'),
+                {'a': [1, 2]},
+            )
+            self.assertEqual(
+                replayed.get_json_links('https://example.org/'),
+                ({'a': [1, 2]}, {'next': 'https://example.org/?page=2'}),
+            )
+            with self.assertRaises(MissingResponse):
+                replayed.get_json('https://example.org/other')
+
+    def test_invalid(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'cassette.json.gz')
+            for obj in ({'https://example.org/': {}}, []):
+                with gzip.open(filename, 'wt') as fp:
+                    json.dump(obj, fp)
+                with self.assertRaises(ValueError):
+                    Cassette().replay(filename)
+
+    def test_replay(self):
+        cassette.mode = 'replay'
+        cassette.responses = {
+            'https://api.github.com/repos/remram44/depoverflow/issues/1': {
+                'updated_at': '2021-10-23T16:37:51Z',
+            },
+            'https://api.stackexchange.com/2.3/posts/13445719'
+            + '?site=stackoverflow.com': {
+                'items': [{'post_id': 13445719, 'last_edit_date': 1500}],
+            },
+            'https://api.stackexchange.com/2.3/posts/13445719/comments'
+            + '?site=stackoverflow.com': {
+                'items': [{'post_id': 13445719, 'creation_date': 1600}],
+            },
+        }
+
+        issue = GithubIssue('remram44/depoverflow', 1)
+        answer = StackExchangeAnswer('stackoverflow.com', 13445719)
+        answer.last_edit_date = 1500
+        answer.last_comment_date = 1600
+        self.assertTrue(asyncio.run(check([issue, answer])))
+        self.assertEqual(issue.updated_date, '2021-10-23T16:37:51Z')
+        self.assertFalse(asyncio.run(check([issue])))
+
+    def test_replay_missing(self):
+        cassette.mode = 'replay'
+        cassette.responses = {}
+        items = [
+            GithubIssue('remram44/depoverflow', 1),
+            StackExchangeAnswer('stackoverflow.com', 13445719),
+        ]
+        with self.assertRaises(MissingResponse):
+            asyncio.run(check(items))
+
+class TestGithubBatching(unittest.TestCase):
+    def tearDown(self):
+        cassette.mode = None
+        cassette.responses = {}
+        cassette.links = {}
+
+    def test_repository(self):
+        cassette.mode = 'replay'
+        cassette.responses = {
+            'https://api.github.com/repos/numpy/numpy/issues'
+            + '?state=all&per_page=100&page=1': [
+                {'number': 2, 'updated_at': '2021-06-01T00:00:00Z'},
+                {'number': 3, 'updated_at': '2021-10-23T16:37:51Z'},
+                {'number': 10, 'updated_at': '2021-10-23T16:37:51Z'},
+            ],
+            'https://api.github.com/repos/numpy/numpy/issues/4': {
+                'updated_at': '2021-10-23T16:37:51Z',
+            },
+        }
+
+        items = [GithubIssue('numpy/numpy', i) for i in range(1, 5)]
+        items[0].updated_date = '2021-01-01T00:00:00Z'
+        items[1].updated_date = '2021-06-01T00:00:00Z'
+        items[2].updated_date = '2021-06-01T00:00:00Z'
+        self.assertTrue(asyncio.run(check(items)))
+        self.assertEqual(
+            [item.updated_date for item in items],
+            [
+                '2021-01-01T00:00:00Z',
+                '2021-06-01T00:00:00Z',
+                '2021-10-23T16:37:51Z',
+                '2021-10-23T16:37:51Z',
+            ],
+        )
+
+
+    def test_repository_pages(self):
+        url = (
+            'https://api.github.com/repos/numpy/numpy/issues'
+            + '?state=all&per_page=100&page=%d'
+        )
+        cassette.mode = 'replay'
+        cassette.responses = {
+            url % 1: [
+                {'number': 1000 + i, 'updated_at': '2021-06-01T00:00:00Z'}
+                for i in range(99)
+            ] + [{'number': 2, 'updated_at': '2021-10-23T16:37:51Z'}],
+            url % 2: [{'number': 3, 'updated_at': '2021-10-23T16:37:51Z'}],
+        }
+        cassette.links = {url % 1: {'next': url % 2, 'last': url % 2}}
+
+        items = [GithubIssue('numpy/numpy', i) for i in range(1, 5)]
+        for item in items:
+            item.updated_date = '2021-01-01T00:00:00Z'
+        with mock.patch.object(
+            cassette, 'get_json_links', wraps=cassette.get_json_links,
+        ) as get_json_links:
+            self.assertTrue(asyncio.run(check(items)))
+        self.assertEqual(get_json_links.call_count, 2)
+        self.assertEqual(
+            [item.updated_date for item in items],
+            [
+                '2021-01-01T00:00:00Z',
+                '2021-10-23T16:37:51Z',
+                '2021-10-23T16:37:51Z',
+                '2021-01-01T00:00:00Z',
+            ],
+        )
+
+    def test_repository_overflow(self):
+        url = (
+            'https://api.github.com/repos/numpy/numpy/issues'
+            + '?state=all&per_page=100&page=%d'
+        )
+        cassette.mode = 'replay'
+        cassette.responses = {
+            url % 1: [
+                {'number': 1000 + i, 'updated_at': '2021-06-01T00:00:00Z'}
+                for i in range(99)
+            ] + [{'number': 2, 'updated_at': '2021-10-23T16:37:51Z'}],
+        }
+        cassette.links = {url % 1: {'next': url % 2, 'last': url % 50}}
+        for i in (1, 3, 4):
+            cassette.responses[
+                'https://api.github.com/repos/numpy/numpy/issues/%d' % i
+            ] = {'updated_at': '2021-01-01T00:00:00Z'}
+
+        items = [GithubIssue('numpy/numpy', i) for i in range(1, 5)]
+        for item in items:
+            item.updated_date = '2021-01-01T00:00:00Z'
+        with mock.patch.object(
+            cassette, 'get_json_links', wraps=cassette.get_json_links,
+        ) as get_json_links:
+            self.assertTrue(asyncio.run(check(items)))
+        # First page of the list, then the 3 issues not in it
+        self.assertEqual(get_json_links.call_count, 4)
+        self.assertEqual(items[1].updated_date, '2021-10-23T16:37:51Z')
+
+
+    def test_record_replay(self):
+        # Record, with the dates from before the run
+        items = [GithubIssue('numpy/numpy', i) for i in range(1, 4)]
+        for item in items:
+            item.updated_date = '2021-01-01T00:00:00Z'
+        response = mock.Mock(links={})
+        response.json.return_value = [
+            {'number': 2, 'updated_at': '2021-10-23T16:37:51Z'},
+        ]
+        cassette.record('unused')
+        with mock.patch('requests.get', return_value=response) as get:
+            self.assertTrue(asyncio.run(check(items)))
+        get.assert_called_once_with(
+            'https://api.github.com/repos/numpy/numpy/issues'
+            + '?state=all&since=2021-01-01T00:00:00Z&per_page=100&page=1',
+        )
+
+        # Replay, with the updated dates
+        cassette.mode = 'replay'
+        for item in items:
+            item.updated_date = '2021-10-23T16:37:51Z'
+        self.assertFalse(asyncio.run(check(items)))
+
+    def test_replay_no_list(self):
+        # Issues recorded individually, for example because they were new
+        cassette.mode = 'replay'
+        cassette.responses = {
+            'https://api.github.com/repos/numpy/numpy/issues/%d' % i: {
+                'updated_at': '2021-01-01T00:00:00Z',
+            }
+            for i in range(1, 4)
+        }
+        items = [GithubIssue('numpy/numpy', i) for i in range(1, 4)]
+        for item in items:
+            item.updated_date = '2021-01-01T00:00:00Z'
+        self.assertFalse(asyncio.run(check(items)))
+
+class TestFailFast(unittest.TestCase):
+    def tearDown(self):
+        cassette.mode = None
+        cassette.responses = {}
+
+    def test_likelihood(self):
+        now = 1634000000
+        old = GithubIssue('remram44/depoverflow', 1)
+        old.updated_date = '2020-01-01T00:00:00Z'
+        old.state = 'open'
+        recent = GithubIssue('remram44/depoverflow', 2)
+        recent.updated_date = '2021-10-10T00:00:00Z'
+        recent.state = 'closed'
+        recent_open = GithubIssue('remram44/depoverflow', 3)
+        recent_open.updated_date = '2021-10-10T00:00:00Z'
+        recent_open.state = 'open'
+        answer = StackExchangeAnswer('stackoverflow.com', 13445719)
+        answer.last_edit_date = now - 5 * 86400
+        answer.last_comment_date = now - 50 * 86400
+        new = GithubIssue('remram44/depoverflow', 4)
+        new_answer = StackExchangeAnswer('stackoverflow.com', 2)
+        stable_answer = StackExchangeAnswer('stackoverflow.com', 3)
+        stable_answer.creation_date = now - 1000 * 86400
+        self.assertEqual(
+            sorted(
+                [old, recent, recent_open, answer, new, stable_answer],
+                key=lambda item: item.change_likelihood(now),
+                reverse=True,
+            ),
+            [new, recent_open, recent, answer, old, stable_answer],
+        )
+        self.assertEqual(new_answer.change_likelihood(now), 1.0)
+
+    def test_stop(self):
+        # Only the most likely item is in the cassette, fetching another
+        # would fail
+        cassette.mode = 'replay'
+        cassette.responses = {
+            'https://api.github.com/repos/remram44/depoverflow/issues/2': {
+                'updated_at': '2021-10-23T16:37:51Z',
+                'state': 'open',
+            },
+        }
+        old = GithubIssue('remram44/other', 1)
+        old.updated_date = '2020-01-01T00:00:00Z'
+        recent = GithubIssue('remram44/depoverflow', 2)
+        recent.updated_date = '2021-10-10T00:00:00Z'
+        with mock.patch.object(depoverflow.main, 'FAIL_FAST_ROUND_SIZE', 1):
+            self.assertTrue(asyncio.run(check([old, recent], fail_fast=True)))
+        self.assertEqual(recent.updated_date, '2021-10-23T16:37:51Z')
+        self.assertEqual(recent.state, 'open')
+
+
+    def test_groups(self):
+        cassette.mode = 'replay'
+        cassette.responses = {
+            'https://api.github.com/repos/numpy/numpy/issues'
+            + '?state=all&per_page=100&page=1': [
+                {'number': 2, 'updated_at': '2021-10-23T16:37:51Z'},
+            ],
+        }
+        items = [GithubIssue('numpy/numpy', i) for i in range(1, 4)]
+        items[0].updated_date = '2021-01-01T00:00:00Z'
+        items[1].updated_date = '2021-06-01T00:00:00Z'
+        items[2].updated_date = '2021-10-01T00:00:00Z'
+        # Less likely than the numpy issues, and not in the cassette
+        other = GithubIssue('remram44/depoverflow', 1)
+        other.updated_date = '2020-01-01T00:00:00Z'
+        # With rounds of 1 item, all the numpy issues are still checked
+        # together, with a single query
+        with mock.patch.object(
+            depoverflow.main, 'FAIL_FAST_ROUND_SIZE', 1,
+        ), mock.patch.object(
+            cassette, 'get_json_links', wraps=cassette.get_json_links,
+        ) as get_json_links:
+            self.assertTrue(asyncio.run(check(
+                items + [other], fail_fast=True,
+            )))
+        self.assertEqual(get_json_links.call_count, 1)
+        self.assertEqual(items[1].updated_date, '2021-10-23T16:37:51Z')
+
+    def test_round(self):
+        cassette.mode = 'replay'
+        cassette.responses = {
+            'https://api.stackexchange.com/2.3/posts/1;2'
+            + '?site=stackoverflow.com': {
+                'items': [
+                    {'post_id': 1, 'last_edit_date': 200},
+                    {'post_id': 2, 'last_edit_date': 300},
+                ],
+            },
+            'https://api.stackexchange.com/2.3/posts/1;2/comments'
+            + '?site=stackoverflow.com': {
+                'items': [],
+            },
+        }
+        answers = [
+            StackExchangeAnswer('stackoverflow.com', 1),
+            StackExchangeAnswer('stackoverflow.com', 2),
+        ]
+        for answer in answers:
+            answer.last_edit_date = 100
+        with self.assertLogs('depoverflow.main', 'WARNING') as logs:
+            self.assertTrue(asyncio.run(check(answers, fail_fast=True)))
+        self.assertEqual(
+            sorted(logs.output),
+            [
+                'WARNING:depoverflow.main:Item has changed: '
+                + 'https://stackoverflow.com/a/1',
+                'WARNING:depoverflow.main:Item has changed: '
+                + 'https://stackoverflow.com/a/2',
+            ],
+        )
+
+
+class TestShards(unittest.TestCase):
+    def setUp(self):
+        depoverflow.main.item_classes = {
+            'github-issue': GithubIssue,
+            'stackexchange-answer': StackExchangeAnswer,
+        }
+
+    def tearDown(self):
+        depoverflow.main.item_classes = None
+
+    def test_get_shard(self):
+        issue = GithubIssue('remram44/depoverflow', 1)
+        self.assertEqual(get_shard(issue, 1), 1)
+        self.assertEqual(get_shard(issue, 4), 4)
+        self.assertEqual(
+            [get_shard(GithubIssue('numpy/numpy', i), 3) for i in range(8)],
+            [3, 3, 3, 2, 1, 1, 2, 3],
+        )
+
+    def test_merge(self):
+        issue = GithubIssue('remram44/depoverflow', 1)
+        issue.updated_date = '2021-10-23T16:37:51Z'
+        answer = StackExchangeAnswer('stackoverflow.com', 13445719)
+        answer.last_edit_date = 1500
+        with tempfile.TemporaryDirectory() as tmp:
+            save_status([issue], os.path.join(tmp, 'status.1'))
+            save_status([answer], os.path.join(tmp, 'status.2'))
+            merged = merge([
+                os.path.join(tmp, 'status.1'),
+                os.path.join(tmp, 'status.2'),
+            ])
+            self.assertEqual(merged, {issue, answer})
+            save_status(merged, os.path.join(tmp, 'merged'))
+            save_status([answer, issue], os.path.join(tmp, 'full'))
+            with open(os.path.join(tmp, 'merged')) as fp:
+                merged = fp.read()
+            with open(os.path.join(tmp, 'full')) as fp:
+                self.assertEqual(merged, fp.read())
+
+
 class TestUtils(unittest.TestCase):
     def test_batch(self):
         self.assertEqual(